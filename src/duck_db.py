@@ -1,20 +1,141 @@
+import argparse
 import duckdb
+import glob
+import hashlib
+import pyarrow.compute as pc
 import os
+import sys
+import threading
 import time
+from concurrent.futures import ThreadPoolExecutor
 from datetime import timedelta, datetime
-import json
+import orjson
 
 
 FILE_NAME="files/yellow_tripdata_2016-03.csv"
 
-def load_csv_to_duckdb(csv_file, con, memory_limit):
+# Decimal places route coordinates are grouped on. The route analysis falls back
+# to one place fewer when the query runs out of memory.
+ROUTE_DECIMALS = 2
+
+# Bump when the layout of the analytics results changes so older cached results are ignored
+CACHE_VERSION = 3
+
+# Explicit column types for the yellow taxi CSV. Narrow types keep the table small
+# and avoid read_csv_auto widening columns to DOUBLE/VARCHAR from a sample.
+YELLOW_TAXI_COLUMNS = {
+    "VendorID": "UTINYINT",
+    "tpep_pickup_datetime": "TIMESTAMP",
+    "tpep_dropoff_datetime": "TIMESTAMP",
+    "passenger_count": "UTINYINT",
+    "trip_distance": "FLOAT",
+    "pickup_longitude": "FLOAT",
+    "pickup_latitude": "FLOAT",
+    "RatecodeID": "UTINYINT",
+    "store_and_fwd_flag": "VARCHAR",
+    "dropoff_longitude": "FLOAT",
+    "dropoff_latitude": "FLOAT",
+    "payment_type": "UTINYINT",
+    "fare_amount": "FLOAT",
+    "extra": "FLOAT",
+    "mta_tax": "FLOAT",
+    "tip_amount": "FLOAT",
+    "tolls_amount": "FLOAT",
+    "improvement_surcharge": "FLOAT",
+    "total_amount": "FLOAT",
+}
+
+# Names for the ISO day of week stored in day_of_week (1=Monday ... 7=Sunday)
+DAY_NAMES = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday")
+
+# payment_type: 1=Credit card, 2=Cash, 3=No charge, 4=Dispute, 5=Unknown, 6=Voided
+PAYMENT_TYPES = {
+    1: "Credit card",
+    2: "Cash",
+    3: "No charge",
+    4: "Dispute",
+    5: "Unknown",
+    6: "Voided",
+}
+
+# GROUPING_ID(hour_of_day, payment_type, day_of_week) for each grouping set of the
+# fused aggregation; a set bit means the column is not part of the grouping set
+GROUPING_SET_IDS = {
+    0b011: "hour",
+    0b101: "payment",
+    0b110: "day",
+    0b010: "hour_by_day",
+}
+
+def convert_csv_to_parquet(csv_file, memory_limit, temp_dir):
     """
-    Load a CSV file into a DuckDB table 
+    Convert a CSV file to Parquet once so later loads skip CSV parsing.
+    Columns are typed from YELLOW_TAXI_COLUMNS instead of being inferred.
+    The file name carries a tag of the column types, and the copy is redone
+    when the CSV is newer than it. Copies made for older column types are removed.
+    
+    Args:
+        csv_file (str): Path to the CSV file to convert
+        memory_limit (str): Memory limit for the conversion
+        temp_dir (str): Directory DuckDB may spill to during the conversion
+        
+    Returns:
+        str: Path to the Parquet file next to the CSV file
+    """
+    schema_tag = hashlib.blake2b(repr(YELLOW_TAXI_COLUMNS).encode()).hexdigest()[:8]
+    csv_stem = os.path.splitext(csv_file)[0]
+    parquet_file = f"{csv_stem}.{schema_tag}.parquet"
+    if os.path.exists(parquet_file) and os.path.getmtime(parquet_file) >= os.path.getmtime(csv_file):
+        print(f"Found existing Parquet file at {parquet_file}")
+        return parquet_file
+    
+    print(f"Converting {csv_file} to Parquet at {parquet_file}...")
+    start_time = time.time()
+    
+    # Use a throwaway connection so the conversion does not touch the database file,
+    # with the same limits as the rest of the run.
+    # Row groups of 122880 rows line up with DuckDB's row group size for scans.
+    # The copy is written to a temporary path and only moved into place once complete,
+    # so a run killed mid-conversion (e.g. by the OOM killer) never leaves a truncated file.
+    columns = ", ".join(f"'{name}': '{dtype}'" for name, dtype in YELLOW_TAXI_COLUMNS.items())
+    tmp_parquet_file = f"{parquet_file}.tmp"
+    conversion_con = duckdb.connect(config={"memory_limit": memory_limit, "temp_directory": temp_dir})
+    try:
+        conversion_con.execute(f"""
+            COPY (
+                SELECT * FROM read_csv_auto(?,
+                                            HEADER=TRUE,
+                                            COLUMNS={{{columns}}},
+                                            SAMPLE_SIZE=-1,
+                                            PARALLEL=TRUE)
+            ) TO '{tmp_parquet_file.replace("'", "''")}' (FORMAT PARQUET, COMPRESSION ZSTD, ROW_GROUP_SIZE 122880)
+        """, [csv_file])
+    except Exception:
+        if os.path.exists(tmp_parquet_file):
+            os.remove(tmp_parquet_file)
+        raise
+    finally:
+        conversion_con.close()
+    os.replace(tmp_parquet_file, parquet_file)
+    
+    # Copies made for older column types are never read again
+    for old_parquet_file in glob.glob(f"{glob.escape(csv_stem)}.????????.parquet"):
+        if old_parquet_file != parquet_file:
+            print(f"Removing superseded Parquet file {old_parquet_file}")
+            os.remove(old_parquet_file)
+    
+    print(f"Conversion completed in {timedelta(seconds=time.time() - start_time)} (HH:MM:SS)")
+    return parquet_file
+
+def load_csv_to_duckdb(csv_file, con, memory_limit, temp_dir):
+    """
+    Load a CSV file into a DuckDB table through its Parquet copy
     
     Args:
         csv_file (str): Path to the CSV file to load
         con (duckdb.DuckDBPyConnection): DuckDB connection
         memory_limit (str): Memory limit configuration
+        temp_dir (str): Directory DuckDB may spill to
         
     Returns:
         tuple: (success, duration, row_count)
@@ -25,13 +146,39 @@ def load_csv_to_duckdb(csv_file, con, memory_limit):
         print("Cleaning up any existing table...")
         con.execute("DROP TABLE IF EXISTS yellow_taxi")
 
-        print(f"Starting to process CSV file with memory limit {memory_limit}...")
+        parquet_file = convert_csv_to_parquet(csv_file, memory_limit, temp_dir)
+
+        print(f"Starting to process Parquet file with memory limit {memory_limit}...")
+        # Materialize hour, ISO day of week and the data quality check once so the
+        # analyses can use them directly instead of recomputing them on every query
+        # Missing coordinates are recorded as 0 in the source data and are stored as NULL.
+        # Rows are stored in pickup time order so each row group's min/max (zone map)
+        # on the pickup timestamp is tight and time ordered scans stay sequential
         con.execute("""
             CREATE TABLE yellow_taxi AS 
-            SELECT * FROM read_csv_auto(?, 
-                                        SAMPLE_SIZE=100000,
-                                        PARALLEL=TRUE)
-        """, [csv_file])
+            SELECT 
+                * REPLACE (
+                    NULLIF(pickup_longitude, 0) AS pickup_longitude,
+                    NULLIF(pickup_latitude, 0) AS pickup_latitude,
+                    NULLIF(dropoff_longitude, 0) AS dropoff_longitude,
+                    NULLIF(dropoff_latitude, 0) AS dropoff_latitude
+                ),
+                CAST(EXTRACT(HOUR FROM tpep_pickup_datetime) AS UTINYINT) AS hour_of_day,
+                CAST(ISODOW(tpep_pickup_datetime) AS UTINYINT) AS day_of_week,
+                tpep_dropoff_datetime > tpep_pickup_datetime
+                    AND trip_distance > 0
+                    AND EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime)) > 60
+                    AS is_clean_trip
+            FROM read_parquet(?)
+            ORDER BY tpep_pickup_datetime
+        """, [parquet_file])
+        
+        # Cleaned trips shared by the analyses that need plausible trips only.
+        # A view over the flag avoids keeping a second copy of the table.
+        con.execute("""
+            CREATE OR REPLACE VIEW yellow_taxi_clean AS
+            SELECT * FROM yellow_taxi WHERE is_clean_trip
+        """)
         
         # Get the number of rows loaded
         result = con.execute("SELECT COUNT(1) as row_count FROM yellow_taxi").fetchone()
@@ -44,55 +191,172 @@ def load_csv_to_duckdb(csv_file, con, memory_limit):
         print(f"Error loading data: {e}")
         return False, duration, 0
 
-def analyze_trips_by_hour(con):
+def fetch_grouped_stats(con):
     """
-    Analyze trip patterns by hour of day
+    Compute the hourly, payment, daily and hour-by-day aggregates in a single
+    scan of yellow_taxi using GROUPING SETS
     
     Args:
         con (duckdb.DuckDBPyConnection): DuckDB connection
         
     Returns:
-        dict: Hour-by-hour statistics
+        dict: Arrow table for each grouping set, keyed by "hour", "payment",
+              "day" and "hour_by_day"
     """
-    print("\nAnalyzing trips by hour of day...")
+    print("\nRunning combined aggregation for hour, payment and day analyses...")
     start_time = time.time()
     
-    # Query to analyze trips by hour of day
-    result = con.execute("""
+    # Tip percentage is total tips over total fares rather than the mean of
+    # per-trip ratios, which avoids a division per row.
+    # The day analysis only looks at plausible trips, so its measures are
+    # computed with FILTER on the materialized is_clean_trip flag while the
+    # others use every row
+    table = con.execute("""
         SELECT 
-            EXTRACT(HOUR FROM tpep_pickup_datetime) AS hour_of_day,
+            GROUPING_ID(hour_of_day, payment_type, day_of_week) AS grouping_id,
+            hour_of_day,
+            payment_type,
+            day_of_week,
             COUNT(*) AS trip_count,
             AVG(trip_distance) AS avg_distance,
             AVG(fare_amount) AS avg_fare,
             AVG(tip_amount) AS avg_tip,
-            AVG(tip_amount / NULLIF(fare_amount, 0)) * 100 AS avg_tip_percentage
-        FROM yellow_taxi
-        GROUP BY hour_of_day
-        ORDER BY hour_of_day
-    """).fetchall()
+            SUM(tip_amount) AS total_tips,
+            100.0 * SUM(tip_amount) / NULLIF(SUM(fare_amount), 0) AS avg_tip_percentage,
+            COUNT(*) FILTER (WHERE is_clean_trip) AS clean_trip_count,
+            AVG(trip_distance) FILTER (WHERE is_clean_trip) AS clean_avg_distance,
+            AVG(fare_amount) FILTER (WHERE is_clean_trip) AS clean_avg_fare,
+            AVG(tip_amount) FILTER (WHERE is_clean_trip) AS clean_avg_tip,
+            AVG(trip_distance / (trip_seconds / 3600)) FILTER (WHERE is_clean_trip) AS avg_speed_mph
+        FROM (
+            SELECT 
+                hour_of_day,
+                payment_type,
+                day_of_week,
+                trip_distance,
+                fare_amount,
+                tip_amount,
+                EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime)) AS trip_seconds,
+                is_clean_trip
+            FROM yellow_taxi
+        )
+        GROUP BY GROUPING SETS (
+            (hour_of_day),
+            (payment_type),
+            (day_of_week),
+            (day_of_week, hour_of_day)
+        )
+    """).fetch_arrow_table()
+    
+    # Split the grouping sets apart and shape each one into the columns its analysis reports
+    sets = {
+        name: table.filter(pc.equal(table["grouping_id"], grouping_id))
+        for grouping_id, name in GROUPING_SET_IDS.items()
+    }
+    grouped_stats = {}
+    
+    hour = sets["hour"].sort_by("hour_of_day")
+    grouped_stats["hour"] = hour.select(
+        ["hour_of_day", "trip_count", "avg_distance", "avg_fare", "avg_tip"]
+    ).rename_columns(
+        ["hour", "trip_count", "avg_distance", "avg_fare", "avg_tip"]
+    ).append_column("tip_percentage", pc.fill_null(hour["avg_tip_percentage"], 0.0))
+    
+    payment = sets["payment"].sort_by([("trip_count", "descending")])
+    grouped_stats["payment"] = payment.select(
+        ["payment_type", "trip_count", "avg_fare", "avg_tip", "total_tips"]
+    ).append_column("tip_percentage", pc.fill_null(payment["avg_tip_percentage"], 0.0))
+    
+    # Days without any clean trip were dropped by the old WHERE clause
+    day = sets["day"].filter(pc.greater(sets["day"]["clean_trip_count"], 0)).sort_by("day_of_week")
+    grouped_stats["day"] = day.select(
+        ["day_of_week", "clean_trip_count", "clean_avg_distance", "clean_avg_fare", "clean_avg_tip"]
+    ).rename_columns(
+        ["day_of_week", "trip_count", "avg_distance", "avg_fare", "avg_tip"]
+    ).append_column("avg_speed_mph", pc.fill_null(day["avg_speed_mph"], 0.0))
+    
+    grouped_stats["hour_by_day"] = sets["hour_by_day"].sort_by(
+        [("day_of_week", "ascending"), ("hour_of_day", "ascending")]
+    ).select(["day_of_week", "hour_of_day", "trip_count"]).rename_columns(["day_of_week", "hour", "trip_count"])
+    
+    duration = time.time() - start_time
+    print(f"Combined aggregation completed in {duration:.2f} seconds")
+    
+    return grouped_stats
+
+def analyze_trips_by_hour(con, grouped_stats=None):
+    """
+    Analyze trip patterns by hour of day
+    
+    Args:
+        con (duckdb.DuckDBPyConnection): DuckDB connection
+        grouped_stats (dict, optional): Output of fetch_grouped_stats. 
+                                        Computed here if not provided.
+        
+    Returns:
+        dict: Hour-by-hour statistics as one list per column
+    """
+    print("\nAnalyzing trips by hour of day...")
+    start_time = time.time()
+    
+    if grouped_stats is None:
+        grouped_stats = fetch_grouped_stats(con)
+    hour_data = grouped_stats["hour"].to_pydict()
     
     duration = time.time() - start_time
     print(f"Analysis completed in {duration:.2f} seconds")
     
-    # Format and print results
-    print("\nTrips by Hour of Day:")
-    print(f"{'Hour':^5}|{'Trip Count':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Tip %':^8}")
-    print("-" * 70)
-    
-    hour_data = {}
-    for row in result:
-        hour, count, distance, fare, tip, tip_pct = row
-        hour_data[int(hour)] = {
-            "trip_count": int(count),
-            "avg_distance": float(distance),
-            "avg_fare": float(fare),
-            "avg_tip": float(tip),
-            "tip_percentage": float(tip_pct) if tip_pct is not None else 0
-        }
-        print(f"{hour:^5}|{count:^12,}|{distance:^15.2f}|${fare:^11.2f}|${tip:^11.2f}|{tip_pct if tip_pct is not None else 0:^8.1f}")
+    # Format results and print them in a single write
+    lines = [
+        "\nTrips by Hour of Day:",
+        f"{'Hour':^5}|{'Trip Count':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Tip %':^8}",
+        "-" * 70,
+    ]
+    
+    for hour, count, distance, fare, tip, tip_pct in zip(*hour_data.values()):
+        lines.append(f"{hour:^5}|{count:^12,}|{distance:^15.2f}|${fare:^11.2f}|${tip:^11.2f}|{tip_pct:^8.1f}")
     
+    sys.stdout.write("\n".join(lines) + "\n")
     return hour_data
 
+def route_key_sql(decimals):
+    """
+    Build the SQL expression packing a route's rounded pickup and dropoff
+    coordinates into a single BIGINT, 16 bits per coordinate
+    
+    Args:
+        decimals (int): Number of decimal places to keep (at most 2)
+        
+    Returns:
+        str: SQL expression evaluating to the route key
+    """
+    scale = 10 ** decimals
+    # Round before offsetting so buckets match ROUND(coordinate, decimals) exactly
+    return f"""(
+        ((CAST(ROUND(pickup_latitude, {decimals}) * {scale} AS BIGINT) + {90 * scale}) << 48)
+        + ((CAST(ROUND(pickup_longitude, {decimals}) * {scale} AS BIGINT) + {180 * scale}) << 32)
+        + ((CAST(ROUND(dropoff_latitude, {decimals}) * {scale} AS BIGINT) + {90 * scale}) << 16)
+        + (CAST(ROUND(dropoff_longitude, {decimals}) * {scale} AS BIGINT) + {180 * scale})
+    )"""
+
+def decode_route_key(route_key, decimals):
+    """
+    Unpack a route key built by route_key_sql
+    
+    Args:
+        route_key (int): Packed route key
+        decimals (int): Number of decimal places the key was built with
+        
+    Returns:
+        tuple: (pickup_long, pickup_lat, dropoff_long, dropoff_lat)
+    """
+    scale = 10 ** decimals
+    pickup_lat = round(((route_key >> 48) & 0xFFFF) / scale - 90, decimals)
+    pickup_long = round(((route_key >> 32) & 0xFFFF) / scale - 180, decimals)
+    dropoff_lat = round(((route_key >> 16) & 0xFFFF) / scale - 90, decimals)
+    dropoff_long = round((route_key & 0xFFFF) / scale - 180, decimals)
+    return pickup_long, pickup_lat, dropoff_long, dropoff_lat
+
 def analyze_popular_routes(con, limit=10):
     """
     Find the most popular routes by pickup and dropoff locations
@@ -102,253 +366,157 @@ def analyze_popular_routes(con, limit=10):
         limit (int): Number of top routes to return
         
     Returns:
-        list: Top routes data
+        dict: Top routes data as one list per column, plus the number of
+        decimal places the coordinates were grouped on
     """
     print(f"\nAnalyzing top {limit} popular routes...")
     start_time = time.time()
     
-    try:
-        # First create a materialized view with rounded coordinates to reduce memory pressure
-        print("Creating optimized view for route analysis...")
-        con.execute("""
-            CREATE OR REPLACE VIEW taxi_routes AS
-            SELECT 
-                ROUND(pickup_longitude, 2) AS pickup_long,
-                ROUND(pickup_latitude, 2) AS pickup_lat,
-                ROUND(dropoff_longitude, 2) AS dropoff_long,
-                ROUND(dropoff_latitude, 2) AS dropoff_lat,
-                trip_distance,
-                fare_amount,
-                tip_amount,
-                total_amount
-            FROM yellow_taxi
-            WHERE pickup_longitude != 0 AND pickup_latitude != 0
-              AND dropoff_longitude != 0 AND dropoff_latitude != 0
-        """)
-        
-        # Now analyze the view with memory-efficient processing
-        print("Processing routes in memory-efficient chunks...")
-        result = con.execute(f"""
+    # Routes are grouped on a single packed BIGINT key instead of four rounded
+    # coordinates. Coordinates outside the valid lat/long range would overflow
+    # their 16 bit slot, so they are filtered out. Missing coordinates were
+    # turned into NULL at load time and fail the same range checks.
+    # Only cleaned trips are considered, and ORDER BY ... LIMIT lets DuckDB
+    # keep only the top routes instead of sorting every group.
+    def routes_query(decimals):
+        return f"""
             SELECT 
-                pickup_long, pickup_lat, 
-                dropoff_long, dropoff_lat,
+                {route_key_sql(decimals)} AS route_key,
                 COUNT(*) AS trip_count,
                 AVG(trip_distance) AS avg_distance,
                 AVG(fare_amount) AS avg_fare,
                 AVG(total_amount) AS avg_total
-            FROM taxi_routes
-            GROUP BY pickup_long, pickup_lat, dropoff_long, dropoff_lat
+            FROM yellow_taxi_clean
+            WHERE pickup_latitude BETWEEN -90 AND 90 AND pickup_longitude BETWEEN -180 AND 180
+              AND dropoff_latitude BETWEEN -90 AND 90 AND dropoff_longitude BETWEEN -180 AND 180
+            GROUP BY route_key
             ORDER BY trip_count DESC
-            LIMIT {limit}
-        """).fetchall()
+            LIMIT ?
+        """
+    
+    decimals = ROUTE_DECIMALS
+    try:
+        result = con.execute(routes_query(decimals), [limit]).fetch_arrow_table()
         
     except Exception as e:
         print(f"Route analysis error: {e}")
-        print("Trying alternative approach with lower precision...")
+        print("Retrying route analysis with lower precision...")
         
         # If that fails, try with less precision (fewer decimal places)
-        result = con.execute(f"""
-            SELECT 
-                ROUND(pickup_longitude, 1) AS pickup_long,
-                ROUND(pickup_latitude, 1) AS pickup_lat,
-                ROUND(dropoff_longitude, 1) AS dropoff_long,
-                ROUND(dropoff_latitude, 1) AS dropoff_lat,
-                COUNT(*) AS trip_count,
-                AVG(trip_distance) AS avg_distance,
-                AVG(fare_amount) AS avg_fare,
-                AVG(total_amount) AS avg_total
-            FROM yellow_taxi
-            WHERE pickup_longitude != 0 AND pickup_latitude != 0
-              AND dropoff_longitude != 0 AND dropoff_latitude != 0
-            GROUP BY pickup_long, pickup_lat, dropoff_long, dropoff_lat
-            ORDER BY trip_count DESC
-            LIMIT {limit}
-        """).fetchall()
+        decimals = ROUTE_DECIMALS - 1
+        result = con.execute(routes_query(decimals), [limit]).fetch_arrow_table()
     
     duration = time.time() - start_time
-    print(f"Analysis completed in {duration:.2f} seconds")
-    
-    print(f"\nTop {limit} Popular Routes:")
-    print(f"{'Pickup (long,lat)':^25}|{'Dropoff (long,lat)':^25}|{'Trip Count':^12}|{'Avg Dist':^10}|{'Avg Fare':^10}")
-    print("-" * 90)
-    
-    routes_data = []
-    for row in result:
-        pickup_long, pickup_lat, dropoff_long, dropoff_lat, count, distance, fare, total = row
-        route = {
-            "pickup": {"longitude": float(pickup_long), "latitude": float(pickup_lat)},
-            "dropoff": {"longitude": float(dropoff_long), "latitude": float(dropoff_lat)},
-            "trip_count": int(count),
-            "avg_distance": float(distance),
-            "avg_fare": float(fare),
-            "avg_total": float(total)
-        }
-        routes_data.append(route)
-        
+    print(f"Route analysis completed in {duration:.2f} seconds")
+    
+    lines = [
+        f"\nTop {limit} Popular Routes:",
+        f"{'Pickup (long,lat)':^25}|{'Dropoff (long,lat)':^25}|{'Trip Count':^12}|{'Avg Dist':^10}|{'Avg Fare':^10}",
+        "-" * 90,
+    ]
+    
+    columns = result.to_pydict()
+    coordinates = [decode_route_key(route_key, decimals) for route_key in columns.pop("route_key")]
+    routes_data = {
+        "pickup_longitude": [pickup_long for pickup_long, _, _, _ in coordinates],
+        "pickup_latitude": [pickup_lat for _, pickup_lat, _, _ in coordinates],
+        "dropoff_longitude": [dropoff_long for _, _, dropoff_long, _ in coordinates],
+        "dropoff_latitude": [dropoff_lat for _, _, _, dropoff_lat in coordinates],
+        **columns,
+    }
+    
+    for pickup_long, pickup_lat, dropoff_long, dropoff_lat, count, distance, fare, total in zip(*routes_data.values()):
         pickup_str = f"({pickup_long:.3f},{pickup_lat:.3f})"
         dropoff_str = f"({dropoff_long:.3f},{dropoff_lat:.3f})"
-        print(f"{pickup_str:^25}|{dropoff_str:^25}|{count:^12,}|{distance:^10.2f}|${fare:^9.2f}")
+        lines.append(f"{pickup_str:^25}|{dropoff_str:^25}|{count:^12,}|{distance:^10.2f}|${fare:^9.2f}")
     
+    sys.stdout.write("\n".join(lines) + "\n")
+    routes_data["decimals"] = decimals
     return routes_data
 
-def analyze_payment_methods(con):
+def analyze_payment_methods(con, grouped_stats=None):
     """
     Analyze usage and tipping behavior by payment method
     
     Args:
         con (duckdb.DuckDBPyConnection): DuckDB connection
+        grouped_stats (dict, optional): Output of fetch_grouped_stats. 
+                                        Computed here if not provided.
         
     Returns:
-        dict: Payment method statistics
+        dict: Payment method statistics as one list per column
     """
     print("\nAnalyzing payment methods...")
     start_time = time.time()
     
-    # Query to analyze payment methods
-    # payment_type: 1=Credit card, 2=Cash, 3=No charge, 4=Dispute, 5=Unknown, 6=Voided
-    result = con.execute("""
-        SELECT 
-            payment_type,
-            CASE payment_type
-                WHEN 1 THEN 'Credit card'
-                WHEN 2 THEN 'Cash'
-                WHEN 3 THEN 'No charge'
-                WHEN 4 THEN 'Dispute'
-                WHEN 5 THEN 'Unknown'
-                WHEN 6 THEN 'Voided'
-                ELSE 'Other'
-            END AS payment_desc,
-            COUNT(*) AS trip_count,
-            AVG(fare_amount) AS avg_fare,
-            AVG(tip_amount) AS avg_tip,
-            SUM(tip_amount) AS total_tips,
-            AVG(tip_amount / NULLIF(fare_amount, 0)) * 100 AS avg_tip_percentage
-        FROM yellow_taxi
-        GROUP BY payment_type, payment_desc
-        ORDER BY trip_count DESC
-    """).fetchall()
+    if grouped_stats is None:
+        grouped_stats = fetch_grouped_stats(con)
+    payment_data = grouped_stats["payment"].to_pydict()
+    payment_data["description"] = [PAYMENT_TYPES.get(payment_type, "Other") for payment_type in payment_data["payment_type"]]
     
     duration = time.time() - start_time
     print(f"Analysis completed in {duration:.2f} seconds")
     
-    # Format and print results
-    print("\nPayment Method Analysis:")
-    print(f"{'Method':^12}|{'Trip Count':^12}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Total Tips':^15}|{'Tip %':^8}")
-    print("-" * 80)
-    
-    payment_data = {}
-    for row in result:
-        payment_id, payment_desc, count, fare, tip, total_tips, tip_pct = row
-        payment_data[str(payment_id)] = {
-            "description": payment_desc,
-            "trip_count": int(count),
-            "avg_fare": float(fare),
-            "avg_tip": float(tip),
-            "total_tips": float(total_tips),
-            "tip_percentage": float(tip_pct) if tip_pct is not None else 0
-        }
-        
-        print(f"{payment_desc:^12}|{count:^12,}|${fare:^11.2f}|${tip:^11.2f}|${total_tips:^14,.2f}|{tip_pct if tip_pct is not None else 0:^8.1f}")
+    # Format results and print them in a single write
+    lines = [
+        "\nPayment Method Analysis:",
+        f"{'Method':^12}|{'Trip Count':^12}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Total Tips':^15}|{'Tip %':^8}",
+        "-" * 80,
+    ]
+    
+    for payment_type, count, fare, tip, total_tips, tip_pct, payment_desc in zip(*payment_data.values()):
+        lines.append(f"{payment_desc:^12}|{count:^12,}|${fare:^11.2f}|${tip:^11.2f}|${total_tips:^14,.2f}|{tip_pct:^8.1f}")
     
+    sys.stdout.write("\n".join(lines) + "\n")
     return payment_data
 
-def analyze_busy_days_and_times(con):
+def analyze_busy_days_and_times(con, grouped_stats=None):
     """
     Analyze busiest days of week and times
     
     Args:
         con (duckdb.DuckDBPyConnection): DuckDB connection
+        grouped_stats (dict, optional): Output of fetch_grouped_stats. 
+                                        Computed here if not provided.
         
     Returns:
-        tuple: (day_stats, hour_by_day_stats)
+        tuple: (day_stats, hour_by_day_stats), each as one list per column
     """
     print("\nAnalyzing busy days and times...")
     start_time = time.time()
     
-    day_result = con.execute("""
-        SELECT 
-            DAYNAME(tpep_pickup_datetime) AS day_name,
-            COUNT(*) AS trip_count,
-            AVG(trip_distance) AS avg_distance,
-            AVG(fare_amount) AS avg_fare,
-            AVG(tip_amount) AS avg_tip,
-            AVG(trip_distance / 
-                (EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime))/3600)) 
-                AS avg_speed_mph
-        FROM yellow_taxi
-        WHERE tpep_dropoff_datetime > tpep_pickup_datetime 
-          AND trip_distance > 0
-          AND EXTRACT(EPOCH FROM (tpep_dropoff_datetime - tpep_pickup_datetime)) > 60
-        GROUP BY day_name
-        ORDER BY 
-            CASE day_name
-                WHEN 'Monday' THEN 1
-                WHEN 'Tuesday' THEN 2
-                WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4
-                WHEN 'Friday' THEN 5
-                WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7
-            END
-    """).fetchall()
-    
-    # Heat map for hour of day by day of week
-    hour_by_day_result = con.execute("""
-        SELECT 
-            DAYNAME(tpep_pickup_datetime) AS day_name,
-            EXTRACT(HOUR FROM tpep_pickup_datetime) AS hour_of_day,
-            COUNT(*) AS trip_count
-        FROM yellow_taxi
-        GROUP BY day_name, hour_of_day
-        ORDER BY 
-            CASE day_name
-                WHEN 'Monday' THEN 1
-                WHEN 'Tuesday' THEN 2
-                WHEN 'Wednesday' THEN 3
-                WHEN 'Thursday' THEN 4
-                WHEN 'Friday' THEN 5
-                WHEN 'Saturday' THEN 6
-                WHEN 'Sunday' THEN 7
-            END,
-            hour_of_day
-    """).fetchall()
+    if grouped_stats is None:
+        grouped_stats = fetch_grouped_stats(con)
+    day_data = grouped_stats["day"].to_pydict()
+    day_data["day"] = [DAY_NAMES[day_of_week - 1] for day_of_week in day_data["day_of_week"]]
+    hour_by_day_data = grouped_stats["hour_by_day"].to_pydict()
+    hour_by_day_data["day"] = [DAY_NAMES[day_of_week - 1] for day_of_week in hour_by_day_data["day_of_week"]]
     
     duration = time.time() - start_time
     print(f"Analysis completed in {duration:.2f} seconds")
-    print("\nBusy Days Analysis:")
-    print(f"{'Day':^10}|{'Trip Count':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Avg Speed':^10}")
-    print("-" * 80)
-    
-    day_data = {}
-    for row in day_result:
-        day, count, distance, fare, tip, speed = row
-        day_data[day] = {
-            "trip_count": int(count),
-            "avg_distance": float(distance),
-            "avg_fare": float(fare),
-            "avg_tip": float(tip),
-            "avg_speed_mph": float(speed) if speed is not None else 0
-        }
-        
-        print(f"{day:^10}|{count:^12,}|{distance:^15.2f}|${fare:^11.2f}|${tip:^11.2f}|{speed if speed is not None else 0:^10.1f}")
-    
-    # Format hour by day data
-    hour_by_day_data = {}
-    for row in hour_by_day_result:
-        day, hour, count = row
-        if day not in hour_by_day_data:
-            hour_by_day_data[day] = {}
-        hour_by_day_data[day][int(hour)] = int(count)
-    
-    print("\nBusiest Hours by Day: (Trip counts)")
-    days = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
-    print(f"{'Hour':^6}|{'Mon':^8}|{'Tue':^8}|{'Wed':^8}|{'Thu':^8}|{'Fri':^8}|{'Sat':^8}|{'Sun':^8}")
-    print("-" * 65)
-    
+    lines = [
+        "\nBusy Days Analysis:",
+        f"{'Day':^10}|{'Trip Count':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Avg Speed':^10}",
+        "-" * 80,
+    ]
+    
+    for day_of_week, count, distance, fare, tip, speed, day in zip(*day_data.values()):
+        lines.append(f"{day:^10}|{count:^12,}|{distance:^15.2f}|${fare:^11.2f}|${tip:^11.2f}|{speed:^10.1f}")
+    
+    # Day x hour grid for the heat map
+    hour_counts = [[0] * 24 for _ in range(7)]
+    for day_of_week, hour, count in zip(hour_by_day_data["day_of_week"], hour_by_day_data["hour"], hour_by_day_data["trip_count"]):
+        hour_counts[day_of_week - 1][hour] = count
+    
+    lines.extend([
+        "\nBusiest Hours by Day: (Trip counts)",
+        f"{'Hour':^6}|{'Mon':^8}|{'Tue':^8}|{'Wed':^8}|{'Thu':^8}|{'Fri':^8}|{'Sat':^8}|{'Sun':^8}",
+        "-" * 65,
+    ])
     for hour in range(24):
-        hour_data = [hour_by_day_data.get(day, {}).get(hour, 0) for day in days]
-        print(f"{hour:^6}|" + "|".join(f"{count:^8,}" for count in hour_data))
+        lines.append(f"{hour:^6}|" + "|".join(f"{day_counts[hour]:^8,}" for day_counts in hour_counts))
     
+    sys.stdout.write("\n".join(lines) + "\n")
     return day_data, hour_by_day_data
 
 def test_percentile_calculation(con):
@@ -374,11 +542,29 @@ def test_percentile_calculation(con):
         # This query specifically tests larger-than-memory capabilities by:
         # 1. Creating a window function across the entire dataset
         # 2. Joining the result back to itself
-        # 3. Calculating percentiles which requires sorting the entire dataset
+        # 3. Bucketing trips into percentiles from approximate quantile boundaries
         # 4. Using the ROWS BETWEEN construct which may not use indexes efficiently
         
-        result = con.execute("""
-            WITH trip_ranks AS (
+        percentile_fractions = ", ".join(str(i / 100) for i in range(1, 100))
+        result = con.execute(f"""
+            WITH distance_quantiles AS (
+                -- Approximate percentile boundaries in one pass instead of a full sort
+                SELECT approx_quantile(trip_distance, [{percentile_fractions}]) as cuts
+                FROM yellow_taxi
+            ),
+            distance_cuts AS (
+                -- One row per boundary with the bucket that starts at it, plus a
+                -- -inf row for bucket 1. Repeated boundaries keep the highest bucket.
+                SELECT cut, MAX(bucket) as bucket
+                FROM (
+                    SELECT UNNEST(cuts) as cut, UNNEST(range(2, 101)) as bucket
+                    FROM distance_quantiles
+                )
+                GROUP BY cut
+                UNION ALL
+                SELECT CAST('-infinity' AS FLOAT), 1
+            ),
+            trip_ranks AS (
                 SELECT 
                     tpep_pickup_datetime,
                     tpep_dropoff_datetime,
@@ -396,21 +582,22 @@ def test_percentile_calculation(con):
                     AVG(fare_amount) OVER (
                         ORDER BY tpep_pickup_datetime 
                         ROWS BETWEEN 10000 PRECEDING AND 10000 FOLLOWING
-                    ) as moving_avg_fare,
-                    -- Percentile calculation requiring full sort
-                    NTILE(100) OVER (ORDER BY trip_distance) as distance_percentile
+                    ) as moving_avg_fare
                 FROM yellow_taxi
             )
             SELECT 
-                distance_percentile,
+                distance_cuts.bucket as distance_percentile,
                 ROUND(AVG(trip_distance), 2) as avg_distance,
                 ROUND(AVG(fare_amount), 2) as avg_fare,
                 ROUND(AVG(tip_amount), 2) as avg_tip,
                 COUNT(*) as trip_count
             FROM trip_ranks
+            -- Percentile bucket of the highest boundary at or below the distance.
+            -- Trips without a distance find no boundary and get no bucket.
+            ASOF JOIN distance_cuts ON trip_ranks.trip_distance >= distance_cuts.cut
             WHERE day_fare_rank <= 1000  -- Still forces processing of all data
-            GROUP BY distance_percentile
-            ORDER BY distance_percentile
+            GROUP BY distance_cuts.bucket
+            ORDER BY distance_cuts.bucket
         """).fetchall()
         
         duration = time.time() - start_time
@@ -419,12 +606,15 @@ def test_percentile_calculation(con):
         print(f"\nLarger-than-memory processing completed in {timedelta(seconds=duration)} (HH:MM:SS)")
         print(f"Successfully processed {len(result)} percentile groups")
         
-        # Print the output
-        print(f"{'Percentile':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Trip Count':^12}")
-        print("-" * 80)
+        # Print the output in a single write
+        lines = [
+            f"{'Percentile':^12}|{'Avg Distance':^15}|{'Avg Fare':^12}|{'Avg Tip':^12}|{'Trip Count':^12}",
+            "-" * 80,
+        ]
         for row in result:
             percentile, avg_distance, avg_fare, avg_tip, trip_count = row
-            print(f"{percentile:^12}|{avg_distance:^15.2f}|${avg_fare:^11.2f}|${avg_tip:^11.2f}|{trip_count:^12,}")
+            lines.append(f"{percentile:^12}|{avg_distance:^15.2f}|${avg_fare:^11.2f}|${avg_tip:^11.2f}|{trip_count:^12,}")
+        sys.stdout.write("\n".join(lines) + "\n")
         
         return True, duration, len(result)
         
@@ -433,13 +623,290 @@ def test_percentile_calculation(con):
         print(f"Error during larger-than-memory test: {e}")
         return False, duration, 0
 
-def main(csv_file=None):
+def analytics_cache_path(con, csv_file):
+    """
+    Build the path of the cached analytics results for the loaded data.
+    The key covers the CSV file's path, modification time and size, the
+    yellow_taxi schema, an explicit DUCKDB_MEMORY_LIMIT, the thread count and
+    CACHE_VERSION, so a change to any of them invalidates the cache.
+    
+    Args:
+        con (duckdb.DuckDBPyConnection): DuckDB connection
+        csv_file (str): Path to the CSV file the table was loaded from
+        
+    Returns:
+        str: Path of the cached JSON results
+    """
+    schema = con.execute("DESCRIBE yellow_taxi").fetchall()
+    # The memory limit sized from available memory changes from run to run and
+    # doesn't change the results (runs that fell back to coarser routes aren't
+    # cached), so only an explicitly configured limit is part of the key
+    memory_limit = os.environ.get('DUCKDB_MEMORY_LIMIT', '')
+    threads = con.execute("SELECT current_setting('threads')").fetchone()[0]
+    key_source = (
+        f"{CACHE_VERSION}:{csv_file}:{os.path.getmtime(csv_file)}:{os.path.getsize(csv_file)}:"
+        f"{schema}:{memory_limit}:{threads}"
+    )
+    key = hashlib.blake2b(key_source.encode()).hexdigest()[:16]
+    return f"db/taxi_analytics_{key}.json"
+
+def write_report(report):
+    """
+    Write serialized analytics results to a timestamped file under reports/
+    
+    Args:
+        report (bytes): Serialized JSON results
+        
+    Returns:
+        str: Path of the report file
+    """
+    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    json_filename = f"reports/duck_db_taxi_analytics_{timestamp}.json"
+    with open(json_filename, "wb") as f:
+        f.write(report)
+    return json_filename
+
+def run_with_cursor(con, analysis, *args):
+    """
+    Run an analysis on its own cursor so it can execute concurrently with
+    other analyses on the same database
+    
+    Args:
+        con (duckdb.DuckDBPyConnection): DuckDB connection
+        analysis (callable): Analysis function taking a connection as first argument
+        *args: Extra arguments for the analysis
+        
+    Returns:
+        The analysis result
+    """
+    cursor = con.cursor()
+    try:
+        return analysis(cursor, *args)
+    finally:
+        cursor.close()
+
+def run_analytics(con, csv_file, concurrent=True):
+    """
+    Run every analysis and save the combined results, or return the cached
+    results if the same data was already analyzed
+    
+    Args:
+        con (duckdb.DuckDBPyConnection): DuckDB connection
+        csv_file (str): Path to the CSV file the table was loaded from
+        concurrent (bool): Run the combined aggregation and the route analysis
+            at the same time instead of one after the other
+        
+    Returns:
+        dict: Combined analytics results
+    """
+    cache_filename = analytics_cache_path(con, csv_file)
+    if os.path.exists(cache_filename):
+        print(f"\nFound cached analytics for this data and configuration at {cache_filename}, skipping analyses")
+        with open(cache_filename, "rb") as f:
+            report = f.read()
+        json_filename = write_report(report)
+        print(f"Cached results (including the large memory test timings of the original run) saved to {json_filename}")
+        return orjson.loads(report)
+    
+    print("\nNote: Analytics may take some time and memory. Individual analyses will continue even if others fail.")
+    # Hour, payment and day analyses share one scan of the table, and the route
+    # analysis is independent of it, so both queries run concurrently on their
+    # own cursors (DuckDB releases the GIL while executing). Their progress lines
+    # can interleave, so each one names its analysis. Both queries share the
+    # connection's memory_limit, so with a single worker they run one after the
+    # other and each gets the whole limit. The larger-than-memory test runs
+    # alone afterwards so its timing isn't skewed.
+    with ThreadPoolExecutor(max_workers=2 if concurrent else 1) as executor:
+        grouped_stats_future = executor.submit(run_with_cursor, con, fetch_grouped_stats)
+        popular_routes_future = executor.submit(run_with_cursor, con, analyze_popular_routes, 10)
+        
+        try:
+            grouped_stats = grouped_stats_future.result()
+        except Exception as e:
+            print(f"Combined hour/payment/day aggregation failed: {e}")
+            grouped_stats = None
+        
+        try:
+            popular_routes = popular_routes_future.result()
+        except Exception as e:
+            print(f"Route analysis failed: {e}")
+            popular_routes = {}
+    
+    # Without the combined aggregation the hour, payment and day analyses have
+    # nothing to report, but the remaining analyses still run
+    hourly_stats, payment_stats, day_stats, hourly_day_stats = {}, {}, {}, {}
+    if grouped_stats is not None:
+        try:
+            hourly_stats = analyze_trips_by_hour(con, grouped_stats)
+        except Exception as e:
+            print(f"Hourly analysis failed: {e}")
+        
+        try:
+            payment_stats = analyze_payment_methods(con, grouped_stats)
+        except Exception as e:
+            print(f"Payment analysis failed: {e}")
+        
+        try:
+            day_stats, hourly_day_stats = analyze_busy_days_and_times(con, grouped_stats)
+        except Exception as e:
+            print(f"Day/time analysis failed: {e}")
+    
+    # Run the larger-than-memory processing test
+    try:
+        large_memory_success, large_memory_duration, large_memory_results = test_percentile_calculation(con)
+        large_memory_test = {
+            "success": large_memory_success,
+            "duration_seconds": large_memory_duration,
+            "result_count": large_memory_results
+        }
+    except Exception as e:
+        print(f"Large memory processing test failed: {e}")
+        large_memory_test = {
+            "success": False,
+            "error": str(e)
+        }
+    
+    # Combine all analytics into a single result
+    analytics_results = {
+        "hourly_stats": hourly_stats,
+        "popular_routes": popular_routes,
+        "payment_stats": payment_stats,
+        "day_stats": day_stats,
+        "hourly_day_stats": hourly_day_stats,
+        "large_memory_test": large_memory_test
+    }
+    
+    report = orjson.dumps(analytics_results, option=orjson.OPT_INDENT_2)
+    json_filename = write_report(report)
+    
+    # Only cache complete runs so that failed analyses are retried next time,
+    # including routes that fell back to coarser coordinates
+    if (large_memory_test["success"] and hourly_stats and payment_stats and day_stats
+            and popular_routes and popular_routes["decimals"] == ROUTE_DECIMALS):
+        with open(cache_filename, "wb") as f:
+            f.write(report)
+    
+    print(f"\nAnalytics complete. Results saved to {json_filename}")
+    return analytics_results
+
+def read_int_file(path):
+    """
+    Read a file holding a single integer, such as a cgroup memory setting
+    
+    Args:
+        path (str): Path of the file
+        
+    Returns:
+        int: The value, or None if the file is missing or not a number (e.g. "max")
+    """
+    try:
+        with open(path) as f:
+            return int(f.read().strip())
+    except (OSError, ValueError):
+        return None
+
+def available_memory():
+    """
+    Determine how much memory is available to this process: MemAvailable from
+    /proc/meminfo (free memory plus reclaimable page cache), capped at what is
+    left under the cgroup memory limit when running in a container
+    
+    Returns:
+        int: Available memory in bytes, or None if it can't be determined
+    """
+    available = None
+    try:
+        with open('/proc/meminfo') as f:
+            for line in f:
+                if line.startswith('MemAvailable:'):
+                    available = int(line.split()[1]) * 1024
+                    break
+    except (OSError, ValueError):
+        pass
+    
+    if available is None:
+        try:
+            available = os.sysconf('SC_AVPHYS_PAGES') * os.sysconf('SC_PAGE_SIZE')
+        except (ValueError, OSError, AttributeError):
+            return None
+    
+    # cgroup v2, then v1
+    for limit_file, usage_file in (
+        ('/sys/fs/cgroup/memory.max', '/sys/fs/cgroup/memory.current'),
+        ('/sys/fs/cgroup/memory/memory.limit_in_bytes', '/sys/fs/cgroup/memory/memory.usage_in_bytes'),
+    ):
+        limit = read_int_file(limit_file)
+        if limit is not None:
+            usage = read_int_file(usage_file) or 0
+            available = min(available, max(limit - usage, 0))
+            break
+    
+    return available
+
+def default_memory_limit():
+    """
+    Pick a DuckDB memory limit of 60% of the memory currently available
+    
+    Returns:
+        str: Memory limit setting, '400MB' if available memory can't be determined
+    """
+    available = available_memory()
+    if not available:
+        return '400MB'
+    return f"{int(available * 0.6) // (1024 * 1024)}MiB"
+
+def warm_up_table(cursor):
+    """
+    Read the columns used by the analyses so their pages are in the OS page
+    cache by the time the analytics start
+    
+    Args:
+        cursor (duckdb.DuckDBPyConnection): Cursor of the main connection, so the
+            caller can interrupt the warm-up and close it
+    """
+    try:
+        cursor.execute("""
+            SELECT 
+                SUM(trip_distance), SUM(fare_amount), SUM(tip_amount), SUM(total_amount),
+                MAX(tpep_pickup_datetime), MAX(tpep_dropoff_datetime)
+            FROM yellow_taxi
+        """).fetchall()
+    except duckdb.InterruptException:
+        # Cancelled because the analyses won't run
+        pass
+    except Exception as e:
+        print(f"Warm-up query failed: {e}")
+
+def parse_args(argv=None):
+    """
+    Parse command line arguments
+    
+    Args:
+        argv (list, optional): Arguments to parse. Defaults to sys.argv.
+        
+    Returns:
+        argparse.Namespace: Parsed arguments
+    """
+    parser = argparse.ArgumentParser(description="Load and analyze NYC Yellow Taxi data with DuckDB")
+    parser.add_argument(
+        "--analytics",
+        action=argparse.BooleanOptionalAction,
+        default=None,
+        help="Run (or with --no-analytics, skip) the comprehensive analytics without asking. "
+             "By default you are asked when running interactively, otherwise analytics run."
+    )
+    return parser.parse_args(argv)
+
+def main(csv_file=None, analytics=None):
     """
     Main function to load and analyze NYC Yellow Taxi data
     
     Args:
         csv_file (str, optional): Path to the CSV file to analyze. 
                                   If not provided, uses the default file.
+        analytics (bool, optional): Whether to run the comprehensive analytics.
+                                    If not provided, asks when stdin is a terminal
+                                    and runs them otherwise.
     """
     # Create directories for database and temp files if they don't exist
     os.makedirs('db', exist_ok=True)
@@ -471,12 +938,17 @@ def main(csv_file=None):
     con = duckdb.connect(database=db_name)
     
     temp_dir = os.environ.get('DUCKDB_TEMP_DIRECTORY', 'db/temp')
-    memory_limit = os.environ.get('DUCKDB_MEMORY_LIMIT', '400MB')
+    # An explicit DUCKDB_MEMORY_LIMIT wins (the docker setup relies on it), otherwise
+    # size the limit from available memory to avoid needless spilling
+    memory_limit = os.environ.get('DUCKDB_MEMORY_LIMIT') or default_memory_limit()
     con.execute(f"SET temp_directory='{temp_dir}'")
     con.execute(f"SET memory_limit='{memory_limit}'")
+    con.execute(f"SET threads={os.cpu_count() or 1}")
+    # None of the analyses depend on row order, so let DuckDB reorder freely
+    con.execute("SET preserve_insertion_order=false")
     
     try:
-        success, load_duration, row_count = load_csv_to_duckdb(csv_file, con, memory_limit)
+        success, load_duration, row_count = load_csv_to_duckdb(csv_file, con, memory_limit, temp_dir)
         
         if success:
             print(f"Successfully loaded {row_count:,} rows into the yellow_taxi table")
@@ -499,67 +971,35 @@ def main(csv_file=None):
             
         print("\nDatabase Information:")
         print("Memory Limit:", con.execute("SELECT current_setting('memory_limit')").fetchone()[0])
+        print("Threads:", con.execute("SELECT current_setting('threads')").fetchone()[0])
         
         print("\nDatabase Statistics:")
         stats = con.execute("PRAGMA database_size").fetchall()
         for stat in stats:
             print(f"- {stat[0]}: {stat[1]}")
         
-        if input("\nWould you like to run comprehensive analytics? (y/n): ").lower() == 'y':
+        if analytics is None:
+            if sys.stdin.isatty():
+                # Warm the page cache in the background while waiting for the answer,
+                # on a separate cursor since the main connection is not shared across threads
+                warm_up_cursor = con.cursor()
+                warm_up = threading.Thread(target=warm_up_table, args=(warm_up_cursor,), daemon=True)
+                warm_up.start()
+                analytics = input("\nWould you like to run comprehensive analytics? (y/n): ").lower() == 'y'
+                if not analytics:
+                    # Nothing will use the warm pages, so cancel the scan instead of
+                    # waiting for it (closing the connection would wait too)
+                    warm_up_cursor.interrupt()
+                warm_up.join()
+                warm_up_cursor.close()
+            else:
+                analytics = True
+        
+        if analytics:
             try:
-                print("\nNote: Analytics may take some time and memory. Individual analyses will continue even if others fail.")
-                hourly_stats = analyze_trips_by_hour(con)
-                
-                try:
-                    popular_routes = analyze_popular_routes(con, limit=10)
-                except Exception as e:
-                    print(f"Route analysis failed: {e}")
-                    popular_routes = []
-                
-                try:
-                    payment_stats = analyze_payment_methods(con)
-                except Exception as e:
-                    print(f"Payment analysis failed: {e}")
-                    payment_stats = {}
-                
-                try:
-                    day_stats, hourly_day_stats = analyze_busy_days_and_times(con)
-                except Exception as e:
-                    print(f"Day/time analysis failed: {e}")
-                    day_stats, hourly_day_stats = {}, {}
-                
-                # Run the larger-than-memory processing test
-                try:
-                    large_memory_success, large_memory_duration, large_memory_results = test_percentile_calculation(con)
-                    large_memory_test = {
-                        "success": large_memory_success,
-                        "duration_seconds": large_memory_duration,
-                        "result_count": large_memory_results
-                    }
-                except Exception as e:
-                    print(f"Large memory processing test failed: {e}")
-                    large_memory_test = {
-                        "success": False,
-                        "error": str(e)
-                    }
-                
-                # Combine all analytics into a single result
-                analytics_results = {
-                    "hourly_stats": hourly_stats,
-                    "popular_routes": popular_routes,
-                    "payment_stats": payment_stats,
-                    "day_stats": day_stats,
-                    "hourly_day_stats": hourly_day_stats,
-                    "large_memory_test": large_memory_test
-                }
-                
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                json_filename = f"reports/duck_db_taxi_analytics_{timestamp}.json"
-                
-                with open(json_filename, "w") as f:
-                    json.dump(analytics_results, f, indent=2)
-                
-                print(f"\nAnalytics complete. Results saved to {json_filename}")
+                # An explicit memory limit is usually tight (e.g. in docker), so the
+                # analyses don't split it between concurrent queries
+                run_analytics(con, csv_file, concurrent=not os.environ.get('DUCKDB_MEMORY_LIMIT'))
             except Exception as e:
                 print(f"Error during analytics: {e}")
             
@@ -569,5 +1009,6 @@ def main(csv_file=None):
         con.close()
 
 if __name__ == "__main__":
-    main(FILE_NAME)
+    args = parse_args()
+    main(FILE_NAME, analytics=args.analytics)
 